@@ -1,25 +1,146 @@
 #!/usr/bin/env python3
 
+import hashlib
+import json
 import logging
-import os
-from typing import Dict, List, Optional, Tuple, cast
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, TextIO, Tuple, TypeVar, cast
 
 import ops
 import yaml
 from charms.data_platform_libs.v0.data_interfaces import DatabaseCreatedEvent, DatabaseRequires
 from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
 from charms.loki_k8s.v0.loki_push_api import LokiPushApiConsumer
-from charms.nginx_ingress_integrator.v0.nginx_route import require_nginx_route
+from charms.nginx_ingress_integrator.v0.nginx_route import NginxRouteRequirer, require_nginx_route
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from charms.redis_k8s.v0.redis import RedisRelationCharmEvents, RedisRequires
 
 import utils
 
+try:
+    # LibYAML bindings, several times faster than the pure Python loader
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:  # pragma: nocover
+    from yaml import SafeLoader as _SafeLoader
+
 # Log messages can be retrieved using juju debug-log
 logger = logging.getLogger(__name__)
 
 SERVICE_PORT = 8000
 DATABASE_NAME = "canonical-cla"
+# bounds for the workload command output returned by actions
+ACTION_OUTPUT_CHUNK_SIZE = 64 * 1024
+ACTION_OUTPUT_LIMIT = 1024 * 1024
+CONFIG_YAML_PATH = Path(__file__).resolve().parent.parent / "config.yaml"
+
+STARTUP_COMMAND = " ".join(
+    [
+        "uvicorn app.main:app",
+        "--host 0.0.0.0",
+        f"--port {SERVICE_PORT}",
+        "--workers 4",
+        "--proxy-headers",
+        "--forwarded-allow-ips '*'",
+    ]
+)
+METRICS_JOBS = [{"static_configs": [{"targets": [f"*:{SERVICE_PORT}"]}]}]
+HEALTH_CHECK_ENDPOINT: ops.pebble.HttpDict = {
+    "url": f"http://localhost:{SERVICE_PORT}/_status/check"
+}
+
+BASE_LOG_TARGET: ops.pebble.LogTargetDict = {
+    "override": "replace",
+    "type": "loki",
+    "services": ["all"],
+}
+BASE_LOG_TARGET_LABELS = {
+    "product": "canonical-cla",
+    "charm": "canonical-cla",
+}
+
+
+def _health_check(level: ops.pebble.CheckLevel) -> ops.pebble.CheckDict:
+    """Return a Pebble HTTP check against the health check endpoint."""
+    return {
+        "override": "replace",
+        "level": level,
+        "http": HEALTH_CHECK_ENDPOINT,
+        "period": "30s",
+        "threshold": 3,
+    }
+
+
+PEBBLE_CHECKS: Dict[str, ops.pebble.CheckDict] = {
+    # Check for readiness: the app is ready to serve requests
+    "online": _health_check(ops.pebble.CheckLevel.READY),
+    # Check for liveness: the app is alive and running
+    "up": _health_check(ops.pebble.CheckLevel.ALIVE),
+}
+
+
+def _load_config_options(path: Path) -> Dict[str, bool]:
+    """Return the options declared in config.yaml, mapped to whether they are secrets.
+
+    Only the option names and their secret tag are needed to validate the config,
+    so that is all that is kept.
+    """
+    with open(path, "rb") as config_file:
+        config = yaml.load(config_file, Loader=_SafeLoader)
+    options = (config or {}).get("options") or {}
+    return {name: (meta or {}).get("type") == "secret" for name, meta in options.items()}
+
+
+# database secret keys, as returned by `utils.fetch_secrets`, mapped to app env vars
+_DB_SECRET_TO_ENV = {
+    "DB_HOST": "DB_HOST",
+    "DB_PORT": "DB_PORT",
+    "DB_USERNAME": "DB_USERNAME",
+    "DB_PASSWORD": "DB_PASSWORD",
+    "DB_NAME": "DB_DATABASE",
+}
+_DB_SECRET_KEYS = frozenset(_DB_SECRET_TO_ENV)
+
+
+def _db_secret_provided(secrets: Dict) -> bool:
+    """Check whether the database secret provides every connection setting."""
+    return secrets.keys() >= _DB_SECRET_KEYS and all(secrets[k] for k in _DB_SECRET_KEYS)
+
+
+# the 'app' service without its environment, which is filled in per hook
+APP_SERVICE: ops.pebble.ServiceDict = {
+    "override": "replace",
+    "startup": "enabled",
+    "working-dir": "srv",
+    "command": STARTUP_COMMAND,
+    "on-check-failure": {
+        # restart on checks.up failure
+        "up": "restart"
+    },
+}
+
+# sentinel for per-event caches whose cached value may legitimately be None
+_MISSING = object()
+_T = TypeVar("_T")
+
+
+def _per_event_cache(method: Callable[[Any], _T]) -> Callable[[Any], _T]:
+    """Memoize a charm method without arguments until the next observed event.
+
+    Results are kept in the charm's `_event_cache`, which every handler clears
+    through `_reset_caches`, so state that changes between events (e.g. under
+    `ops.testing.Harness`) is read again. Exceptions are not cached.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self):
+        value = self._event_cache.get(name, _MISSING)
+        if value is _MISSING:
+            value = self._event_cache[name] = method(self)
+        return value
+
+    return wrapper
 
 
 class FastAPICharm(ops.CharmBase):
@@ -27,35 +148,25 @@ class FastAPICharm(ops.CharmBase):
 
     container: ops.Container
     on = RedisRelationCharmEvents()
+    _stored = ops.StoredState()
 
     def __init__(self, framework: ops.Framework):
         super().__init__(framework)
         # Define the charm events
         self.container = self.unit.get_container("app")
+        self._event_cache: Dict[str, Any] = {}
         framework.observe(self.on.config_changed, self._on_config_changed)
-        framework.observe(self.on.app_pebble_ready,
-                          self._update_layer_and_restart)
+        framework.observe(self.on.app_pebble_ready, self._on_pebble_ready)
         framework.observe(self.on.collect_unit_status, self._on_collect_status)
 
         framework.observe(self.on.migrate_db_action,
                           self._on_migrate_db_action)
         framework.observe(self.on.audit_logs_action,
                           self._on_audit_logs_action)
-        self.unit.open_port("tcp", SERVICE_PORT)
-
-        # Provide ability for prometheus to be scraped by Prometheus using prometheus_scrape
-        self._prometheus_scraping = MetricsEndpointProvider(
-            self,
-            relation_name="metrics-endpoint",
-            jobs=[{"static_configs": [{"targets": [f"*:{SERVICE_PORT}"]}]}],
-        )
+        self._stored.set_default(last_port=None, layer_digest=None)
+        self._open_service_port()
 
-        self._logging = LokiPushApiConsumer(self, relation_name="log-proxy")
-
-        # Provide grafana dashboards over a relation interface
-        self._grafana_dashboards = GrafanaDashboardProvider(
-            self, relation_name="grafana-dashboard"
-        )
+        self._setup_observability()
 
         # Charm events defined in the database requires charm library.
         self.database = DatabaseRequires(
@@ -72,68 +183,138 @@ class FastAPICharm(ops.CharmBase):
         self.framework.observe(
             self.database.on.endpoints_changed, self._on_database_created)
 
-        require_nginx_route(
-            charm=self,
-            service_hostname=self.app.name,
-            service_name=self.app.name,
-            service_port=SERVICE_PORT,
+        # The requirer only pushes its config into existing relations, so skip it
+        # (and its leadership check) until the nginx-route relation is created.
+        self._nginx_route: NginxRouteRequirer | None = None
+        self.framework.observe(
+            self.on["nginx-route"].relation_created, self._require_nginx_route)
+        if self.model.relations["nginx-route"]:
+            self._require_nginx_route()
+
+    def _require_nginx_route(self, _event: ops.RelationCreatedEvent | None = None) -> None:
+        """Set up the nginx-route requirer, once the relation exists."""
+        if self._nginx_route is None:
+            self._nginx_route = require_nginx_route(
+                charm=self,
+                service_hostname=self.app.name,
+                service_name=self.app.name,
+                service_port=SERVICE_PORT,
+            )
+
+    def _open_service_port(self) -> None:
+        """Open the service port unless it was already opened by a previous hook."""
+        if self._stored.last_port == SERVICE_PORT:
+            return
+        self.unit.open_port("tcp", SERVICE_PORT)
+        self._stored.last_port = SERVICE_PORT
+
+    def _setup_observability(self) -> None:
+        """Set up the metrics, logging and dashboard integrations.
+
+        The libraries register their own observers, so they have to be constructed
+        on every dispatch; keep the work they do at construction time minimal.
+        """
+        # Provide ability for prometheus to be scraped by Prometheus using prometheus_scrape.
+        # Pass the refresh event explicitly instead of letting the library derive it
+        # from the charm metadata on every init.
+        self._prometheus_scraping = MetricsEndpointProvider(
+            self,
+            relation_name="metrics-endpoint",
+            jobs=METRICS_JOBS,
+            refresh_event=self.on.app_pebble_ready,
         )
 
+        self._logging = LokiPushApiConsumer(self, relation_name="log-proxy")
+
+        # Provide grafana dashboards over a relation interface
+        self._grafana_dashboards = GrafanaDashboardProvider(
+            self, relation_name="grafana-dashboard"
+        )
+
+    def _reset_caches(self) -> None:
+        """Drop the values cached while handling a previous event."""
+        self._event_cache.clear()
+
     def _on_database_created(self, event: DatabaseCreatedEvent) -> None:
         """Event is fired when postgres database is created."""
-        self._update_layer_and_restart(None)
+        self._reset_caches()
+        self._update_layer_and_restart()
 
     def _on_redis_relation_changed(self, event):
         """Handle the redis relation changed event."""
-        self._update_layer_and_restart(None)
+        self._reset_caches()
+        self._update_layer_and_restart()
 
     def _on_config_changed(self, event: ops.ConfigChangedEvent):
+        self._reset_caches()
         self._update_layer_and_restart()
 
+    def _on_pebble_ready(self, event: ops.PebbleReadyEvent):
+        """Handle the workload container becoming ready."""
+        self._reset_caches()
+        self._update_layer_and_restart(force=True)
+
     def _on_collect_status(self, event):
+        """Report the first failing check, in order of precedence, or active."""
+        self._reset_caches()
+        checks = (
+            self._check_config,
+            self._check_db_blocked,
+            self._check_db_data,
+            self._check_redis_relation,
+            self._check_redis_data,
+            self._check_service_running,
+        )
+        for check in checks:
+            status = check()
+            if status is not None:
+                event.add_status(status)
+                return
+        event.add_status(ops.ActiveStatus())
+
+    def _check_config(self) -> ops.StatusBase | None:
         (valid, message) = self.config_valid_values()
         if not valid:
             message = f"Config values are not valid: {message}"
-            event.add_status(ops.BlockedStatus(message))
             logger.warning(message)
-            return
-        try:
-            status = self.container.get_service("app")
-        except (ops.pebble.APIError, ops.ModelError, ops.pebble.ConnectionError) as e:
-            error_message = "Waiting for Pebble in workload container"
-            event.add_status(ops.MaintenanceStatus(error_message))
-            logger.warning(f"{error_message}: %s", e)
-            return
+            return ops.BlockedStatus(message)
 
-        db_blocked_status = self.postgres_relation_blocked()
-        if db_blocked_status:
-            event.add_status(db_blocked_status)
-            logger.warning(db_blocked_status.message)
-            return
-        elif not self.fetch_postgres_relation_data():
+    def _check_db_blocked(self) -> ops.StatusBase | None:
+        # already logged when the database state was computed
+        return self.postgres_relation_blocked()
+
+    def _check_db_data(self) -> ops.StatusBase | None:
+        if not self.fetch_postgres_relation_data():
             # We need the charms to finish integrating.
-            event.add_status(ops.WaitingStatus(
-                "Waiting for database relation"))
-            return
+            return ops.WaitingStatus("Waiting for database relation")
+
+    def _check_redis_relation(self) -> ops.StatusBase | None:
         if not self.get_relation("redis"):
             error_message = (
                 "Waiting relation to redis,  run 'juju relate redis-k8s:redis canonical-cla:redis'"
             )
-            event.add_status(ops.BlockedStatus(error_message))
             logger.warning(error_message)
-            return
-        elif not self.fetch_redis_relation_data():
+            return ops.BlockedStatus(error_message)
+
+    def _check_redis_data(self) -> ops.StatusBase | None:
+        if not self.fetch_redis_relation_data():
             error_message = "Waiting for redis relation"
-            event.add_status(ops.WaitingStatus(error_message))
             logger.warning(error_message)
-            return
-        elif not status.is_running():
-            event.add_status(ops.MaintenanceStatus(
-                "Waiting for the service to start up"))
-        else:
-            event.add_status(ops.ActiveStatus())
+            return ops.WaitingStatus(error_message)
 
-    def _update_layer_and_restart(self, event=None) -> None:
+    def _check_service_running(self) -> ops.StatusBase | None:
+        # Only query Pebble once every relation is in place. A ModelError here means
+        # the 'app' service is not in the plan yet, which is also a transient state.
+        try:
+            status = self.container.get_service("app")
+        except (ops.pebble.APIError, ops.ModelError, ops.pebble.ConnectionError) as e:
+            error_message = "Waiting for Pebble in workload container"
+            logger.warning("%s: %s", error_message, e)
+            return ops.MaintenanceStatus(error_message)
+        if not status.is_running():
+            return ops.MaintenanceStatus("Waiting for the service to start up")
+
+    def _update_layer_and_restart(self, *, force: bool = False) -> None:
         """Define and start a workload using the Pebble API.
 
         You'll need to specify the right entrypoint and environment
@@ -141,28 +322,44 @@ class FastAPICharm(ops.CharmBase):
         standard entrypoint of an existing container using docker inspect
 
         Learn more about Pebble layers at https://github.com/canonical/pebble
-        """
 
-        new_layer_services = self._pebble_layer.to_dict().get("services", {})
+        Pebble's replan only restarts services whose configuration changed, so it
+        is used for every update instead of unconditionally restarting 'app'.
+
+        A digest of the last applied layer is kept in stored state, so hooks that
+        would apply the same layer again return without querying Pebble. Use `force`
+        when the plan may have been lost, i.e. when the workload container (re)starts.
+        """
+        layer_dict = self._build_pebble_layer()
+        # Compare canonical forms so key ordering never triggers a restart
+        digest = hashlib.blake2b(
+            json.dumps(layer_dict, sort_keys=True, default=str).encode(), digest_size=16
+        ).hexdigest()
+        layer_changed = digest != self._stored.layer_digest
+        if not force and not layer_changed:
+            return
         try:
             # Get the current pebble layer config
             services = self.container.get_plan().to_dict().get("services", {})
-            if services != new_layer_services:
-                # Changes were made, add the new layer
+            new = json.dumps(layer_dict.get("services", {}), sort_keys=True, default=str)
+            current = json.dumps(services, sort_keys=True, default=str)
+            # The checks and log targets are not compared with the plan, so a changed
+            # digest always adds the layer; a forced update only does when the
+            # services were lost.
+            if layer_changed or current != new:
                 self.container.add_layer(
-                    "app", self._pebble_layer, combine=True)
-                logger.info(f"Added updated layer 'app' to Pebble plan")
-                if event and isinstance(event, ops.PebbleReadyEvent):
-                    self.container.replan()
-                else:
-                    self.container.restart("app")
-                    logger.info(f"Restarted 'app' service")
+                    "app", ops.pebble.Layer(layer_dict), combine=True)
+                logger.info("Added updated layer 'app' to Pebble plan")
+                self.container.replan()
+                logger.info("Replanned 'app' service")
+            self._stored.layer_digest = digest
 
         except (ops.pebble.ConnectionError, ops.pebble.APIError):
             logger.debug("Error updating Pebble layer", exc_info=True)
 
     def _on_migrate_db_action(self, event: ops.ActionEvent):
         """Handle the migrate-db action."""
+        self._reset_caches()
         # if db relation is not available, we can't run migrations
         # db_relation = self.get_relation("database")
 
@@ -175,21 +372,16 @@ class FastAPICharm(ops.CharmBase):
         event.log(f"Running {' '.join(cmd)}")
 
         try:
-
-            (stdout, stderr) = self.container.exec(
-                cmd, environment=self.app_environment, combine_stderr=True, working_dir="/srv"
-            ).wait_output()
+            output = self._exec_output_tail(cmd, working_dir="/srv")
             event.set_results(
                 {
                     "result": "Migrations completed successfully",
-                    "full-stdout": stdout,
-                    "full-stderr": stderr,
+                    "full-stdout": output,
                 }
             )
         except ops.pebble.ExecError as e:
             event.fail(f"Migration command failed: {e}")
-            event.set_results(
-                {"full-stderr": e.stderr, "full-stdout": e.stdout})
+            event.set_results({"full-stdout": e.stdout})
             return
         except ops.pebble.ChangeError as e:
             event.fail(f"Failed to run migrations: {e}")
@@ -197,6 +389,7 @@ class FastAPICharm(ops.CharmBase):
 
     def _on_audit_logs_action(self, event: ops.ActionEvent):
         """Handle the audit-logs action."""
+        self._reset_caches()
         try:
             since = event.params.get("since")
             until = event.params.get("until")
@@ -208,79 +401,74 @@ class FastAPICharm(ops.CharmBase):
                 cmd.append("--until")
                 cmd.append(until)
 
-            logs = self.container.exec(
-                cmd, environment=self.app_environment, combine_stderr=True)
+            logs = self._exec_output_tail(cmd)
             event.set_results({"logs": logs})
-        except ops.model.ModelError as e:
+        except ops.pebble.ExecError as e:
+            event.fail(f"Audit logs command failed: {e}")
+            event.set_results({"logs": e.stdout})
+        except (ops.model.ModelError, ops.pebble.ChangeError) as e:
             event.fail(f"Failed to get logs: {e}")
 
-    @property
-    def _pebble_layer(self):
-        """Return a dictionary representing a Pebble layer."""
-        health_check_endpoint: ops.pebble.HttpDict = {
-            "url": f"http://localhost:{SERVICE_PORT}/_status/check"
-        }
-        uvicorn_command = " ".join(
-            [
-                "uvicorn app.main:app",
-                "--host 0.0.0.0",
-                f"--port {SERVICE_PORT}",
-                "--workers 4",
-                "--proxy-headers",
-                "--forwarded-allow-ips '*'",
-            ]
-        )
+    def _exec_output_tail(self, cmd: list[str], **kwargs) -> str:
+        """Run a command in the workload and return the tail of its combined output.
+
+        The output is read in chunks of `ACTION_OUTPUT_CHUNK_SIZE` and only the last
+        `ACTION_OUTPUT_LIMIT` characters are kept, so a long running command can't
+        grow the charm's memory without bound.
+
+        :raises: `ops.pebble.ExecError` if the command fails, with the output tail
+            as its `stdout`.
+        """
+        process = self.container.exec(
+            cmd, environment=self.app_environment, combine_stderr=True, **kwargs)
+        output = ""
+        truncated = False
+        # stdout is always set since no stdout stream was passed to exec
+        stdout = cast(TextIO, process.stdout)
+        while chunk := stdout.read(ACTION_OUTPUT_CHUNK_SIZE):
+            output += chunk
+            if len(output) > ACTION_OUTPUT_LIMIT:
+                output = output[-ACTION_OUTPUT_LIMIT:]
+                truncated = True
+        if truncated:
+            logger.warning("Output of %s truncated to the last %d characters",
+                           cmd[0], ACTION_OUTPUT_LIMIT)
+        try:
+            process.wait()
+        except ops.pebble.ExecError as e:
+            e.stdout = output
+            raise
+        return output
+
+    def _build_pebble_layer(self) -> ops.pebble.LayerDict:
+        """Return a dictionary representing a Pebble layer.
 
+        Only the environment and log targets vary; the rest comes from the
+        module-level `APP_SERVICE` and `PEBBLE_CHECKS` templates. The dictionary
+        is only wrapped in a `ops.pebble.Layer` when it is written.
+        """
         pebble_layer: ops.pebble.LayerDict = {
-            "services": {
-                "app": {
-                    "override": "replace",
-                    "startup": "enabled",
-                    "working-dir": "srv",
-                    "command": uvicorn_command,
-                    "environment": self.app_environment,
-                    "on-check-failure": {
-                        # restart on checks.up failure
-                        "up": "restart"
-                    },
-                }
-            },
+            "services": {"app": {**APP_SERVICE, "environment": self.app_environment}},
             "log-targets": self.pebble_log_targets,
-            "checks": {
-                # Check for readiness: the app is ready to serve requests
-                "online": {
-                    "override": "replace",
-                    "level": ops.pebble.CheckLevel.READY,
-                    "http": health_check_endpoint,
-                    "period": "30s",
-                    "threshold": 3,
-                },
-                # Check for liveness: the app is alive and running
-                "up": {
-                    "override": "replace",
-                    "level": ops.pebble.CheckLevel.ALIVE,
-                    "http": health_check_endpoint,
-                    "period": "30s",
-                    "threshold": 3,
-                },
-            },
+            "checks": PEBBLE_CHECKS,
         }
-        return ops.pebble.Layer(pebble_layer)
+        return pebble_layer
 
     @property
-    def app_environment(self):
+    @_per_event_cache
+    def app_environment(self) -> Dict[str, str]:
         """This property method creates a dictionary containing environment variables
         for the application. It retrieves the database authentication data by calling
         the `fetch_postgres_relation_data` method and uses it to populate the dictionary.
-        If any of the values are not present, it will be set to None.
-        The method returns this dictionary as output.
+        Unset values are left out of the dictionary.
+        The dictionary is computed once per event, see `_reset_caches`.
         """
         is_valid, message = self.config_valid_values()
         if not is_valid:
             logger.warning(message)
             return {}
 
-        env_vars = utils.map_config_to_env_vars(self)
+        env_vars = utils.map_config_to_env_vars(self, secrets=self._cached_secrets())
 
         # add database connection details if available
         db_data = self.fetch_postgres_relation_data()
@@ -301,72 +489,78 @@ class FastAPICharm(ops.CharmBase):
 
         env_vars["PYTHONPATH"] = "/srv"
 
-        return env_vars
+        # drop unset optional values and stringify the rest the way Pebble stores
+        # them, otherwise they would never match the applied plan
+        return {
+            k: str(v).lower() if isinstance(v, bool) else str(v)
+            for k, v in env_vars.items()
+            if v is not None
+        }
 
     @property
+    @_per_event_cache
     def pebble_log_targets(self) -> Dict[str, ops.pebble.LogTargetDict]:
         """Return a dictionary representing a Pebble log target.
-        [Pebble docs](https://canonical-pebble.readthedocs-hosted.com/en/latest/reference/log-forwarding/)."""
-        loki_push_api_locations = cast(List[str], [endpoint.get(
-            "url") for endpoint in self._logging.loki_endpoints if endpoint.get("url")])
+        [Pebble docs](https://canonical-pebble.readthedocs-hosted.com/en/latest/reference/log-forwarding/).
+
+        Computed once per event, like `app_environment`."""
+        loki_push_api_locations = [
+            url for endpoint in self._logging.loki_endpoints if (url := endpoint.get("url"))]
         if not loki_push_api_locations:
             logger.error("Loki push api not available")
             return {}
         else:
-            logger.info(f"Loki push api locations: {loki_push_api_locations}")
-        base_log_target = {
-            "override": "replace",
-            "type": "loki",
-            "services": ["all"],
+            logger.info("Loki push api locations: %s", loki_push_api_locations)
+        base_log_target: ops.pebble.LogTargetDict = {
+            **BASE_LOG_TARGET,
             "labels": {
-                "product": "canonical-cla",
-                "charm": "canonical-cla",
+                **BASE_LOG_TARGET_LABELS,
                 "juju_unit": self.unit.name,
                 "juju_application": self.app.name,
             }
         }
-        targets = {}
-        for index, location in enumerate(loki_push_api_locations):
-            targets[f"loki-{index}"] = {
-                **base_log_target,
-                "location": location
-            }
-
-        return targets
+        # the labels dict is shared by reference; dict.fromkeys drops duplicate
+        # endpoints while keeping their order
+        return {
+            f"loki-{index}": {**base_log_target, "location": location}
+            for index, location in enumerate(dict.fromkeys(loki_push_api_locations))
+        }
 
+    @_per_event_cache
     def config_valid_values(self) -> Tuple[bool, str]:
-        """Check if the config values are valid."""
-        base_dir = os.getcwd()
+        """Check if the config values are valid.
+
+        The config cannot change while an event is handled, so the result is
+        computed once per event and reused by every caller.
+        """
         try:
-            config = yaml.safe_load(open(f"{base_dir}/config.yaml"))
-            config_items = config.get("options", None)
+            config_items = _load_config_options(CONFIG_YAML_PATH)
             if not config_items:
                 return False, "No options found in config.yaml"
-            for config_name, config_meta in config_items.items():
-                is_secret = config_meta.get("type") == "secret"
-                config_value = self.config.get(config_name)
-                if config_value is None:
+            for config_name, is_secret in config_items.items():
+                if self.config.get(config_name) is None:
                     resource_name = is_secret and "Secret" or "Config"
                     return False, f"{resource_name} value {config_name} is not set"
         except Exception as e:
             logger.error("Error reading config.yaml: %s", e)
             return False, "Error reading config.yaml"
         try:
-            utils.fetch_secrets(self)
+            self._cached_secrets()
         except ValueError as e:
             return False, f"Error fetching secrets: {e}"
         return True, ""
 
+    @_per_event_cache
+    def _cached_secrets(self) -> Dict:
+        """Return the charm secrets, fetched from the Juju secret store once per event.
+
+        :raises: `ValueError` if some secrets are not found.
+        """
+        return utils.fetch_secrets(self)
+
     def postgres_relation_blocked(self) -> ops.StatusBase | None:
-        secrets = utils.fetch_secrets(self)
-        db_secret_provided = all(
-            secrets.get(key)
-            for key in ["db_host", "db_port", "db_name", "db_username", "db_password"]
-        )
-        if not db_secret_provided and not self.get_relation("database"):
-            error_message = "Waiting relation to database,  run 'juju integrate postgresql-k8s canonical-cla' or provide db secret"
-            logger.warning(error_message)
-            return ops.BlockedStatus(error_message)
+        """Return a blocked status if neither a db secret nor a database relation is set."""
+        return self._db_env_and_status()[1]
 
     def fetch_postgres_relation_data(self) -> Dict | None:
         """Fetch postgres relation data.
@@ -376,36 +570,48 @@ class FastAPICharm(ops.CharmBase):
         then logged for debugging purposes, and any non-empty data is processed to extract
         endpoint information, username, and password. This processed data is then returned as
         a dictionary. If no data is retrieved, the unit is set to waiting status and
-        the program exits with a zero status code."""
-        db_secret = utils.fetch_secrets(self)
-        if all(
-            db_secret.get(key)
-            for key in ["db_host", "db_port", "db_name", "db_username", "db_password"]
-        ):
+        the program exits with a zero status code.
+
+        The result is memoized until the next event."""
+        return self._db_env_and_status()[0]
+
+    @_per_event_cache
+    def _db_env_and_status(self) -> Tuple[Dict | None, ops.StatusBase | None]:
+        """Return the database env vars and the blocked status, computed once per event.
+
+        The db secret takes precedence over the database relation. When neither is
+        available the env is None and a blocked status is returned.
+        """
+        db_secret = self._cached_secrets()
+        if _db_secret_provided(db_secret):
+            return {env: db_secret[key] for key, env in _DB_SECRET_TO_ENV.items()}, None
+        if not self.get_relation("database"):
+            error_message = "Waiting relation to database,  run 'juju integrate postgresql-k8s canonical-cla' or provide db secret"
+            logger.warning(error_message)
+            return None, ops.BlockedStatus(error_message)
+        return self._postgres_relation_env(), None
+
+    def _postgres_relation_env(self) -> Dict | None:
+        relations = self._cached_relations()
+        data = next((d for d in relations.values() if d and d.get("username")), None)
+        if data is not None:
+            host, _, port = data["endpoints"].rpartition(":")
             return {
-                "DB_HOST": db_secret["db_host"],
-                "DB_PORT": db_secret["db_port"],
-                "DB_USERNAME": db_secret["db_username"],
-                "DB_PASSWORD": db_secret["db_password"],
-                "DB_DATABASE": db_secret["db_name"],
+                "DB_HOST": host,
+                "DB_PORT": port,
+                "DB_USERNAME": data["username"],
+                "DB_PASSWORD": data["password"],
+                "DB_DATABASE": DATABASE_NAME,
             }
-        relations = self.database.fetch_relation_data()
-        if relations:
-            for data in relations.values():
-                if not data or not data.get("username"):
-                    continue
-                host, port = data["endpoints"].split(":")
-                db_data = {
-                    "DB_HOST": host,
-                    "DB_PORT": port,
-                    "DB_USERNAME": data["username"],
-                    "DB_PASSWORD": data["password"],
-                    "DB_DATABASE": DATABASE_NAME,
-                }
-                return db_data
         logger.warning("No database relation data available")
         return None
 
+    @_per_event_cache
+    def _cached_relations(self) -> Dict:
+        """Return the database relation data, read from the databag once per event."""
+        return self.database.fetch_relation_data()
+
+    @_per_event_cache
     def fetch_redis_relation_data(self) -> Dict | None:
         """Get the hostname and port from the redis relation data.
 
@@ -413,6 +619,8 @@ class FastAPICharm(ops.CharmBase):
             Tuple with the hostname and port of the related redis
         Raises:
             MissingRedisRelationDataError if the some of redis relation data is malformed/missing
+
+        The result is memoized until the next event.
         """
         relation_data = self.redis.relation_data
         if not relation_data:
@@ -432,14 +640,8 @@ class FastAPICharm(ops.CharmBase):
         It returns the first active relation object that matches the name.
         If there are no relations with the given name, it returns None.
         """
-        relations = self.model.relations[name]
-        active_relations = [
-            relation for relation in relations if relation.active]
-        num_related = len(active_relations)
-
-        if num_related == 0:
-            return None
-        return active_relations[0]
+        return next(
+            (relation for relation in self.model.relations[name] if relation.active), None)
 
 
 if __name__ == "__main__":  # pragma: nocover
@@ -1,7 +1,11 @@
-from pydantic import BaseModel
+from dataclasses import MISSING, dataclass, fields
 
+# maps the "-" and "." separators used in secret and config keys to "_"
+NORMALIZE_KEY_TABLE = str.maketrans({"-": "_", ".": "_"})
 
-class Secret(BaseModel):
+
+@dataclass(slots=True)
+class Secret:
     secret_key: str
     internal_api_secret: str
 
@@ -17,19 +21,37 @@ class Secret(BaseModel):
     smtp_username: str
     smtp_password: str
 
-    db_host: str | None
-    db_port: int | None
-    db_name: str | None
-    db_username: str | None
-    db_password: str | None
-
     canonical_oidc_client_id: str
     canonical_oidc_client_secret: str
-    canonical_oidc_server_url: str | None
-    canonical_oidc_scope: str | None
-    canonical_oidc_token_endpoint_auth_method: str | None
+    canonical_oidc_server_url: str | None = None
+    canonical_oidc_scope: str | None = None
+    canonical_oidc_token_endpoint_auth_method: str | None = None
+
+    db_host: str | None = None
+    db_port: int | None = None
+    db_name: str | None = None
+    db_username: str | None = None
+    db_password: str | None = None
 
     @staticmethod
     def parse(**kwargs):
-        # replace - with _ and . with _
-        return Secret(**{k.replace("-", "_").replace(".", "_"): v for k, v in kwargs.items()})
+        """Build a `Secret` from secret content.
+
+        Keys must already be normalized with `NORMALIZE_KEY_TABLE` (- and . replaced
+        with _); unknown keys are ignored.
+
+        :raises: `ValueError` if a required field is missing or a port is not an integer.
+        """
+        values = {k: v for k, v in kwargs.items() if k in SECRET_FIELDS}
+        missing = sorted(REQUIRED_SECRET_FIELDS - values.keys())
+        if missing:
+            raise ValueError(f"missing secret fields: {', '.join(missing)}")
+        for name in INT_SECRET_FIELDS:
+            if values.get(name) is not None:
+                values[name] = int(values[name])
+        return Secret(**values)
+
+
+SECRET_FIELDS = frozenset(f.name for f in fields(Secret))
+REQUIRED_SECRET_FIELDS = frozenset(f.name for f in fields(Secret) if f.default is MISSING)
+INT_SECRET_FIELDS = ("smtp_port", "db_port")
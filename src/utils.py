@@ -3,24 +3,30 @@ from typing import TypedDict
 
 import ops
 
-from secret import Secret
+from secret import NORMALIZE_KEY_TABLE, SECRET_FIELDS, Secret
 
 
-def map_config_to_env_vars(charm: ops.CharmBase, **additional_env):
+def env_var_name(key: str) -> str:
+    """Return the environment variable name for a config or secret key."""
+    return key.translate(NORMALIZE_KEY_TABLE).upper()
+
+
+def map_config_to_env_vars(charm: ops.CharmBase, secrets: dict | None = None, **additional_env):
     """
     Map the config values provided in config.yaml into environment variables.
 
     After that, the vars can be passed directly to the pebble layer.
     Variables must match the form <Key1>_<key2>_<key3>...
+
+    :param charm: The charm instance.
+    :param secrets: Already fetched secrets, as returned by `fetch_secrets`.
+        When not provided, the secrets are fetched from the model.
     """
-    env_mapped_config = {}
-    for k, v in charm.config.items():
-        if str(v).startswith("secret:"):
-            continue
-        env_mapped_config.update(
-            {k.replace("-", "_").replace(".", "_").upper(): v})
+    env_mapped_config = {
+        env_var_name(k): v for k, v in charm.config.items() if not str(v).startswith("secret:")
+    }
 
-    env_mapped_config.update(fetch_secrets(charm))
+    env_mapped_config.update(fetch_secrets(charm) if secrets is None else secrets)
 
     return {**env_mapped_config, **additional_env}
 
@@ -30,23 +36,30 @@ def fetch_secrets(charm: ops.CharmBase):
     Fetch the secrets from the model and return them as a dictionary.
 
     The keys are the secret names and the values are the secret values.
+    Each secret is fetched once, with its latest revision; callers are expected to
+    reuse the result for the rest of the hook.
 
     :param charm: The charm instance.
 
     :return: A dictionary with the secret names and values.
     :raises: `ValueError` if some secrets are not found.
     """
+    # the same secret may be bound to several options, fetch each one only once
+    secret_ids = dict.fromkeys(
+        str(v) for v in charm.config.values() if str(v).startswith("secret:"))
     secrets_values = {}
-    for v in charm.config.values():
-        if str(v).startswith("secret:"):
-            secret_value_dict = charm.model.get_secret(
-                id=str(v)).get_content(refresh=True)
-            secrets_values.update(secret_value_dict)
-    parsed_secrets = Secret.parse(**secrets_values).dict()
+    for secret_id in secret_ids:
+        secret_value_dict = charm.model.get_secret(
+            id=secret_id).get_content(refresh=True)
+        secrets_values.update(secret_value_dict)
+    normalized = {k.translate(NORMALIZE_KEY_TABLE): v for k, v in secrets_values.items()}
+    # the model is only used for validation, its fields are the known secret keys
+    Secret.parse(**normalized)
     secrets = {}
-    for k, v in parsed_secrets.items():
-        # avoid setting empty strings
-        if not (isinstance(v, str) and v == ""):
+    for k, v in normalized.items():
+        # skip unknown keys and avoid setting empty strings
+        if k in SECRET_FIELDS and v != "":
+            # the key is already normalized
             secrets[k.upper()] = v
     return secrets
 
@@ -57,11 +70,9 @@ ProxyDict = TypedDict(
 
 def get_proxy_dict(cfg) -> ProxyDict | None:
     """Generate an http proxy server configuration dictionary."""
-    proxies: ProxyDict = {
-        "HTTP_PROXY": cfg.get("http_proxy", "") or os.environ.get("JUJU_CHARM_HTTP_PROXY", ""),
-        "HTTPS_PROXY": cfg.get("https_proxy", "") or os.environ.get("JUJU_CHARM_HTTPS_PROXY", ""),
-        "NO_PROXY": cfg.get("no_proxy", "") or os.environ.get("JUJU_CHARM_NO_PROXY", ""),
-    }
-    if all(v == "" for v in proxies.values()):
+    http_proxy = cfg.get("http_proxy", "") or os.environ.get("JUJU_CHARM_HTTP_PROXY", "")
+    https_proxy = cfg.get("https_proxy", "") or os.environ.get("JUJU_CHARM_HTTPS_PROXY", "")
+    no_proxy = cfg.get("no_proxy", "") or os.environ.get("JUJU_CHARM_NO_PROXY", "")
+    if not (http_proxy or https_proxy or no_proxy):
         return None
-    return proxies
+    return {"HTTP_PROXY": http_proxy, "HTTPS_PROXY": https_proxy, "NO_PROXY": no_proxy}
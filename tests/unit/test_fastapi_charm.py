@@ -0,0 +1,263 @@
+# Copyright 2024 Ubuntu
+# See LICENSE file for licensing details.
+#
+# Learn more about testing at: https://juju.is/docs/sdk/testing
+
+import unittest
+from unittest.mock import patch
+
+import ops
+import ops.testing
+
+from charm import FastAPICharm
+from secret import NORMALIZE_KEY_TABLE, Secret
+
+APP_SECRETS = {
+    "secret_key": {"secret-key": "secret"},
+    "internal_api_secret": {"internal-api-secret": "internal"},
+    "github_oauth": {"github-oauth-client-id": "id", "github-oauth-client-secret": "secret"},
+    "github": {
+        "github-app-id": "1",
+        "github-app-private-key": "key",
+        "github-app-secret": "secret",
+    },
+    "canonical_oidc": {
+        "canonical-oidc-client-id": "id",
+        "canonical-oidc-client-secret": "secret",
+    },
+    "smtp": {
+        "smtp-host": "smtp.example.com",
+        "smtp-port": "25",
+        "smtp-username": "user",
+        "smtp-password": "password",
+    },
+}
+DB_SECRET = {
+    "db-host": "secret-db",
+    "db-port": "5433",
+    "db-name": "secret-name",
+    "db-username": "secret-user",
+    "db-password": "secret-password",
+}
+DB_RELATION_DATA = {
+    "endpoints": "relation-db:5432",
+    "username": "relation-user",
+    "password": "relation-password",
+}
+
+
+class TestCharm(unittest.TestCase):
+    def setUp(self):
+        self.harness = ops.testing.Harness(FastAPICharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+
+    def set_secrets(self, database: dict | None = None, **overrides: dict):
+        """Set every config option, with the secret options pointing to user secrets."""
+        contents = {**APP_SECRETS, "database": database or {"db-host": ""}, **overrides}
+        config = {"app_url": "https://cla.example.com", "sentry_dsn": "https://sentry"}
+        for option, content in contents.items():
+            secret_id = self.harness.add_user_secret(content)
+            self.harness.grant_secret(secret_id, self.harness.charm.app.name)
+            config[option] = secret_id
+        self.harness.update_config(config)
+
+    def add_database_relation(self) -> int:
+        return self.harness.add_relation("database", "postgresql-k8s", app_data=DB_RELATION_DATA)
+
+    def relate_all(self, **secrets: dict):
+        """Connect the workload container and provide every secret and relation."""
+        self.harness.set_can_connect("app", True)
+        self.set_secrets(**secrets)
+        self.add_database_relation()
+        self.harness.add_relation(
+            "redis", "redis-k8s", unit_data={"hostname": "redis", "port": "6379"}
+        )
+
+    def applied_environment(self) -> dict:
+        plan = self.harness.get_container_pebble_plan("app").to_dict()
+        return plan["services"]["app"]["environment"]
+
+    def test_status_follows_relations_between_events(self):
+        self.set_secrets()
+        self.harness.evaluate_status()
+        self.assertIsInstance(self.harness.model.unit.status, ops.BlockedStatus)
+        self.assertIn("Waiting relation to database", self.harness.model.unit.status.message)
+
+        self.add_database_relation()
+        self.harness.evaluate_status()
+        self.assertIsInstance(self.harness.model.unit.status, ops.BlockedStatus)
+        self.assertIn("Waiting relation to redis", self.harness.model.unit.status.message)
+
+    def test_database_relation_env(self):
+        self.set_secrets()
+        self.add_database_relation()
+        self.harness.charm._reset_caches()
+        self.assertEqual(
+            self.harness.charm.fetch_postgres_relation_data(),
+            {
+                "DB_HOST": "relation-db",
+                "DB_PORT": "5432",
+                "DB_USERNAME": "relation-user",
+                "DB_PASSWORD": "relation-password",
+                "DB_DATABASE": "canonical-cla",
+            },
+        )
+
+    def test_database_secret_takes_precedence_over_relation(self):
+        self.set_secrets(database=DB_SECRET)
+        self.add_database_relation()
+        self.harness.charm._reset_caches()
+        self.assertEqual(
+            self.harness.charm.fetch_postgres_relation_data(),
+            {
+                "DB_HOST": "secret-db",
+                "DB_PORT": "5433",
+                "DB_USERNAME": "secret-user",
+                "DB_PASSWORD": "secret-password",
+                "DB_DATABASE": "secret-name",
+            },
+        )
+        self.assertIsNone(self.harness.charm.postgres_relation_blocked())
+
+    def test_incomplete_database_secret_requires_relation(self):
+        self.set_secrets(database={"db-host": "secret-db"})
+        self.harness.evaluate_status()
+        self.assertIsInstance(self.harness.model.unit.status, ops.BlockedStatus)
+        self.assertIn("Waiting relation to database", self.harness.model.unit.status.message)
+
+    def test_missing_required_secret_field_blocks(self):
+        self.set_secrets(smtp={"smtp-host": "smtp.example.com"})
+        self.harness.evaluate_status()
+        self.assertIsInstance(self.harness.model.unit.status, ops.BlockedStatus)
+        self.assertIn("missing secret fields", self.harness.model.unit.status.message)
+        self.assertIn("smtp_port", self.harness.model.unit.status.message)
+
+    def test_invalid_int_secret_field_blocks(self):
+        self.set_secrets(smtp={**APP_SECRETS["smtp"], "smtp-port": "not-a-port"})
+        self.harness.evaluate_status()
+        self.assertIsInstance(self.harness.model.unit.status, ops.BlockedStatus)
+        self.assertIn("Error fetching secrets", self.harness.model.unit.status.message)
+
+    def test_applied_environment_is_stringified(self):
+        self.relate_all()
+        env = self.applied_environment()
+        self.assertEqual(env["MAINTENANCE_MODE"], "false")
+        self.assertEqual(env["SMTP_PORT"], "25")
+        self.assertEqual(env["DB_PORT"], "5432")
+        self.assertTrue(all(isinstance(v, str) for v in env.values()))
+        # optional secret fields that are not set are left out
+        self.assertNotIn("CANONICAL_OIDC_SCOPE", env)
+
+    def test_unchanged_layer_skips_pebble(self):
+        self.relate_all()
+        container = self.harness.charm.container
+        with patch.object(container, "get_plan") as get_plan, patch.object(
+            container, "add_layer"
+        ) as add_layer:
+            self.harness.charm.on.config_changed.emit()
+        get_plan.assert_not_called()
+        add_layer.assert_not_called()
+
+    def test_changed_environment_applies_layer(self):
+        self.relate_all()
+        container = self.harness.charm.container
+        with patch.object(container, "replan", wraps=container.replan) as replan:
+            self.harness.update_config({"app_name": "Other CLA"})
+        replan.assert_called_once()
+        self.assertEqual(self.applied_environment()["APP_NAME"], "Other CLA")
+
+    def test_pebble_ready_reapplies_lost_layer(self):
+        self.relate_all()
+        container = self.harness.charm.container
+        with patch.object(
+            container, "get_plan", return_value=ops.pebble.Plan("{}")
+        ) as get_plan, patch.object(
+            container, "add_layer", wraps=container.add_layer
+        ) as add_layer:
+            self.harness.container_pebble_ready("app")
+        get_plan.assert_called_once()
+        add_layer.assert_called_once()
+        self.assertEqual(self.applied_environment()["DB_HOST"], "relation-db")
+
+    def test_nginx_route_not_required_without_relation(self):
+        self.assertIsNone(self.harness.charm._nginx_route)
+
+    def test_nginx_route_relation_gets_service_config(self):
+        self.harness.set_leader(True)
+        relation_id = self.harness.add_relation("nginx-route", "nginx-ingress-integrator")
+        self.assertIsNotNone(self.harness.charm._nginx_route)
+        app_data = self.harness.get_relation_data(relation_id, self.harness.charm.app)
+        self.assertEqual(app_data["service-hostname"], "canonical-cla")
+        self.assertEqual(app_data["service-port"], "8000")
+
+    def test_nginx_route_required_once_for_existing_relation(self):
+        harness = ops.testing.Harness(FastAPICharm)
+        self.addCleanup(harness.cleanup)
+        harness.set_leader(True)
+        relation_id = harness.add_relation("nginx-route", "nginx-ingress-integrator")
+        harness.begin_with_initial_hooks()
+        app_data = harness.get_relation_data(relation_id, harness.charm.app)
+        self.assertEqual(app_data["service-port"], "8000")
+
+
+class TestActions(unittest.TestCase):
+    def setUp(self):
+        self.harness = ops.testing.Harness(FastAPICharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_can_connect("app", True)
+        self.harness.begin()
+
+    def test_migrate_db(self):
+        self.harness.handle_exec("app", ["alembic"], result="upgraded\n")
+        output = self.harness.run_action("migrate-db")
+        self.assertEqual(
+            output.results,
+            {"result": "Migrations completed successfully", "full-stdout": "upgraded\n"},
+        )
+
+    def test_migrate_db_failure(self):
+        self.harness.handle_exec(
+            "app", ["alembic"], result=ops.testing.ExecResult(exit_code=1, stdout="boom\n")
+        )
+        with self.assertRaises(ops.testing.ActionFailed) as cm:
+            self.harness.run_action("migrate-db")
+        self.assertIn("Migration command failed", cm.exception.message)
+        self.assertEqual(cm.exception.output.results, {"full-stdout": "boom\n"})
+
+    def test_audit_logs(self):
+        self.harness.handle_exec("app", ["python3"], result="log line\n")
+        output = self.harness.run_action("audit-logs", {"since": "2024-01-01"})
+        self.assertEqual(output.results, {"logs": "log line\n"})
+
+    def test_audit_logs_failure(self):
+        self.harness.handle_exec(
+            "app", ["python3"], result=ops.testing.ExecResult(exit_code=2, stdout="error\n")
+        )
+        with self.assertRaises(ops.testing.ActionFailed) as cm:
+            self.harness.run_action("audit-logs")
+        self.assertIn("Audit logs command failed", cm.exception.message)
+        self.assertEqual(cm.exception.output.results, {"logs": "error\n"})
+
+
+class TestSecret(unittest.TestCase):
+    def setUp(self):
+        self.content = {
+            k.translate(NORMALIZE_KEY_TABLE): v
+            for values in APP_SECRETS.values()
+            for k, v in values.items()
+        }
+
+    def test_parse_ignores_unknown_keys(self):
+        secret = Secret.parse(**self.content, unknown="ignored")
+        self.assertEqual(secret.github_app_id, "1")
+        self.assertEqual(secret.smtp_port, 25)
+        self.assertIsNone(secret.db_port)
+
+    def test_parse_missing_required_fields(self):
+        with self.assertRaisesRegex(ValueError, "missing secret fields: .*secret_key"):
+            Secret.parse(smtp_host="smtp.example.com")
+
+    def test_parse_invalid_int_field(self):
+        with self.assertRaises(ValueError):
+            Secret.parse(**self.content, db_port="not-a-port")